@@ -0,0 +1,343 @@
+"""
+Shared render path for the V20-V23 single-still FFmpeg endpoints.
+
+Each beam_ffmpeg_vNN.py file only declares its Beam image/endpoint and calls
+render() with the stream-mapping strategy it was built to exercise:
+
+    filter_complex  - V20: audio through a named filter_complex output
+    direct_map      - V21: no filter labels, direct -map indices
+    simple_filters  - V22: -af on an auto-mapped audio input
+    explicit_map    - V23: video first, explicit -map of both streams, CRF encode
+"""
+
+import os
+import subprocess
+import requests
+import base64
+import functools
+import math
+import shutil
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import cloudinary
+import cloudinary.uploader
+from mutagen.mp3 import MP3
+from PIL import Image as PILImage, ImageOps
+
+# h264_nvenc needs a GPU worker (e.g. gpu="T4") with an NVENC-enabled ffmpeg; CPU workers keep libx264
+VIDEO_ENCODER = os.environ.get("VIDEO_ENCODER", "libx264")
+FPS = 24
+FRAME_SIZE = (1080, 1920)
+STILL_SEGMENT_SECONDS = 1
+ENCODER_THREADS = 4  # matches cpu=4 on the endpoints
+STRATEGIES = ("filter_complex", "direct_map", "simple_filters", "explicit_map")
+
+# Uploads run off the request thread so they overlap with output verification. Threads rather than
+# processes: upload_large spends its time in socket I/O and TLS, both of which release the GIL
+_UPLOAD_POOL = ThreadPoolExecutor(max_workers=4)
+
+# One keep-alive pool per container so warm invocations skip the DNS/TCP/TLS setup
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=32, pool_maxsize=32,
+                                       max_retries=Retry(total=3, backoff_factor=0.2)))
+
+# Parsed once per container; warm invocations reuse it
+if os.environ.get("CLOUDINARY_URL"):
+    cloudinary.config(cloudinary_url=os.environ["CLOUDINARY_URL"])
+
+
+def stage_binary(name: str, bin_dir: str = "/dev/shm/bin") -> str:
+    """Copy a binary into tmpfs once per container so every exec maps it from RAM. Falls back to PATH lookup."""
+    staged = os.path.join(bin_dir, name)
+    if os.path.exists(staged):
+        return staged
+    source = shutil.which(name)
+    if not source:
+        return name
+    try:
+        os.makedirs(bin_dir, exist_ok=True)
+        tmp = f"{staged}.{uuid.uuid4().hex[:8]}"
+        shutil.copy2(source, tmp)
+        os.chmod(tmp, 0o755)
+        os.replace(tmp, staged)
+        return staged
+    except OSError as e:
+        print(f"Could not stage {name} in {bin_dir}: {e}")
+        return source
+
+
+@functools.lru_cache(maxsize=None)
+def ffmpeg_binaries() -> tuple:
+    """(ffmpeg, ffprobe) paths, staged on first use so importing this module touches no files."""
+    return stage_binary("ffmpeg"), stage_binary("ffprobe")
+
+
+# Resolve all dynamic symbols at exec instead of lazily during the encode
+FFMPEG_ENV = {**os.environ, "LD_BIND_NOW": "1"}
+
+
+def render(version: str, strategy: str, voiceover_url: str, animated_video_urls: list = None) -> dict:
+    """Render the first visual as a still under the voiceover and return the uploaded (or data) URL."""
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown render strategy: {strategy}")
+    tag = f"[{version}]"
+    # Stage the binaries before the job starts so the first exec doesn't pay for the copy mid-render
+    ffmpeg_binaries()
+    job_id = str(uuid.uuid4())[:8]
+    # Per-job intermediates live in RAM-backed tmpfs; /cache is kept for cross-invocation data
+    job_dir = f"/dev/shm/render_{job_id}"
+    os.makedirs(job_dir, exist_ok=True)
+
+    print(f"{tag} ===== Job {job_id} ({strategy}) =====")
+
+    try:
+        # 1 + 2. Download voiceover and first image from animated_video_urls concurrently
+        voiceover_path = f"{job_dir}/voiceover.mp3"
+        image_path = f"{job_dir}/image.png"
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            image_future = pool.submit(prepare_image, animated_video_urls, image_path)
+            download_file(voiceover_url, voiceover_path)
+
+            # Get voiceover duration from the MP3 headers (overlaps with the image download)
+            duration = probe_duration(voiceover_path)
+            print(f"{tag} Voiceover duration: {duration}s")
+
+            image_downloaded = image_future.result()
+        print(f"{tag} Image downloaded" if image_downloaded else f"{tag} Created black fallback image")
+
+        # 3. Encode the letterboxed still once; the render only stream-copies it
+        output_path = f"{job_dir}/output.mp4"
+        segment_path = f"{job_dir}/still_segment.mp4"
+        encode_still_segment(image_path, "setsar=1", segment_path, strategy)
+        concat_path = write_concat_list(segment_path, duration)
+
+        cmd = build_render_cmd(strategy, voiceover_path, concat_path, duration, output_path)
+        print(f"{tag} FFmpeg command: {' '.join(cmd)}")
+
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=300, env=FFMPEG_ENV)
+
+        if result.returncode != 0:
+            print(f"{tag} FFmpeg STDERR (last 1000): {result.stderr[-1000:]}")
+            raise Exception(f"FFmpeg failed (code {result.returncode}): {result.stderr[-500:]}")
+
+        # 4. Verify output
+        if not os.path.exists(output_path):
+            raise Exception("Output file missing")
+
+        size = os.path.getsize(output_path)
+        print(f"{tag} Output size: {size} bytes")
+
+        if size < 1000:
+            raise Exception(f"Output too small: {size} bytes")
+
+        # 5. Start the Cloudinary upload now; verification runs while it is in flight
+        cloudinary_url = os.environ.get("CLOUDINARY_URL")
+        upload_future = None
+        if cloudinary_url:
+            print(f"{tag} Uploading to Cloudinary...")
+            upload_future = _UPLOAD_POOL.submit(upload_video, output_path, job_id)
+
+        try:
+            verify_output(output_path, tag)
+        except Exception:
+            if upload_future:
+                discard_upload(upload_future, job_id)
+            raise
+
+        if upload_future:
+            video_url = upload_future.result()
+            print(f"{tag} Upload complete: {video_url}")
+        else:
+            video_url = file_to_data_url(output_path)
+
+        return {"video_url": video_url, "render_id": job_id, "version": version}
+
+    except Exception as e:
+        print(f"{tag} ERROR: {e}")
+        raise
+    finally:
+        shutil.rmtree(job_dir, ignore_errors=True)
+
+
+def build_render_cmd(strategy: str, voiceover_path: str, concat_path: str, duration: float, output_path: str) -> list:
+    """Mux the stream-copied still with the voiceover using the given strategy's stream mapping."""
+    still_input = ['-f', 'concat', '-safe', '0', '-i', concat_path]
+    audio_args = ['-c:a', 'aac', '-b:a', '128k', '-ar', '44100', '-ac', '2']
+
+    if strategy == "explicit_map":
+        # Still segment is input 0, voiceover input 1
+        inputs = [*still_input, '-i', voiceover_path]
+        mapping = ['-map', '0:v', '-map', '1:a', '-t', str(duration), '-shortest']
+        audio_args = ['-c:a', 'aac', '-b:a', '128k']
+    else:
+        # Voiceover is input 0, still segment input 1
+        inputs = ['-i', voiceover_path, *still_input]
+        if strategy == "filter_complex":
+            # Use LONGER tag names - Beam.cloud seems to strip single-letter brackets
+            mapping = ['-filter_complex', "[0:a]aresample=44100,volume=2.0[audio_out]",
+                       '-map', '1:v', '-map', '[audio_out]']
+        elif strategy == "direct_map":
+            mapping = ['-map', '1:v', '-map', '0:a']
+        else:
+            mapping = ['-af', "aresample=44100,volume=2.0"]
+        mapping += ['-t', str(duration)]
+
+    ffmpeg, _ = ffmpeg_binaries()
+    return [
+        ffmpeg, '-y', '-hide_banner', '-loglevel', 'info',
+        *inputs,
+        *mapping,
+        '-c:v', 'copy',
+        *audio_args,
+        # Reels ingest needs a progressive MP4 with moov up front; a fragmented (empty_moov) file is
+        # rejected, and the faststart rewrite is a tmpfs memcpy of a few MB
+        '-movflags', '+faststart',
+        output_path
+    ]
+
+
+def verify_output(output_path: str, tag: str) -> None:
+    """Check for the ftyp box; ffmpeg already exited 0 with +faststart. DEBUG_VERIFY adds a full ffprobe."""
+    with open(output_path, 'rb') as fh:
+        head = fh.read(12)
+    if head[4:8] != b'ftyp':
+        raise Exception(f"Invalid format: missing ftyp box ({head!r})")
+
+    if os.environ.get("DEBUG_VERIFY"):
+        _, ffprobe = ffmpeg_binaries()
+        verify = subprocess.run(
+            [ffprobe, '-v', 'error', '-show_entries', 'format=format_name,duration',
+             '-show_entries', 'stream=codec_type,codec_name',
+             '-of', 'json', output_path],
+            capture_output=True, text=True, env=FFMPEG_ENV
+        )
+        print(f"{tag} Probe result: {verify.stdout[:500] if verify.stdout else verify.stderr[:500]}")
+        if verify.returncode != 0:
+            raise Exception(f"Output not valid: {verify.stderr}")
+
+
+def video_codec_args(strategy: str) -> list:
+    """Video encoder flags for VIDEO_ENCODER. NVENC moves motion search and entropy coding off the CPU."""
+    if VIDEO_ENCODER == "h264_nvenc":
+        return ['-c:v', 'h264_nvenc', '-preset', 'p4', '-tune', 'hq', '-rc', 'vbr',
+                '-b:v', '2M', '-maxrate', '3M', '-profile:v', 'baseline']
+    if strategy == "explicit_map":
+        rate_control = ['-tune', 'stillimage', '-crf', '26']
+    else:
+        rate_control = ['-level', '3.0', '-b:v', '2M']
+    return ['-c:v', 'libx264', '-profile:v', 'baseline', '-preset', 'ultrafast', *rate_control,
+            '-bf', '0', '-refs', '1', '-sc_threshold', '0', *x264_thread_args()]
+
+
+def x264_thread_args() -> list:
+    """Frame-threaded x264 pinned to the container's vCPUs instead of the 1.5x-cores default."""
+    return ['-threads', str(ENCODER_THREADS),
+            '-x264-params', f'threads={ENCODER_THREADS}:sliced-threads=0:lookahead-threads=1:rc-lookahead=20']
+
+
+def download_file(url: str, dest: str) -> str:
+    """Download a file from URL or decode base64 data URI."""
+    if url.startswith('data:'):
+        _, data = url.split(',', 1)
+        with open(dest, 'wb') as f:
+            f.write(base64.b64decode(data))
+        return dest
+
+    with _SESSION.get(url, timeout=(5, 55), stream=True) as r:
+        r.raise_for_status()
+        r.raw.decode_content = True
+        with open(dest, 'wb') as f:
+            shutil.copyfileobj(r.raw, f, length=1 << 20)
+    return dest
+
+
+def probe_duration(audio_path: str) -> float:
+    """Read the voiceover duration from its MP3 headers, falling back to ffprobe for anything mutagen can't parse."""
+    try:
+        return MP3(audio_path).info.length
+    except Exception as e:
+        print(f"mutagen could not read {audio_path} ({e}); falling back to ffprobe")
+    _, ffprobe = ffmpeg_binaries()
+    probe = subprocess.run(
+        [ffprobe, '-v', 'error', '-show_entries', 'format=duration',
+         '-of', 'default=noprint_wrappers=1:nokey=1', audio_path],
+        capture_output=True, text=True, check=True, env=FFMPEG_ENV
+    )
+    return float(probe.stdout.strip())
+
+
+def prepare_image(animated_video_urls: list, image_path: str) -> bool:
+    """Download the first visual, or create a black fallback. Returns True if downloaded.
+
+    The still is letterboxed to FRAME_SIZE here, in-process, so ffmpeg needs no scale/pad filtergraph.
+    """
+    if animated_video_urls:
+        download_file(animated_video_urls[0].replace("turbo:", ""), image_path)
+        with PILImage.open(image_path) as img:
+            frame = ImageOps.pad(img.convert('RGB'), FRAME_SIZE, method=PILImage.BILINEAR, color='black')
+        frame.save(image_path, format='PNG', compress_level=0)
+        return True
+    PILImage.new('RGB', FRAME_SIZE, color='black').save(image_path, format='PNG', compress_level=0)
+    return False
+
+
+def encode_still_segment(image_path: str, video_filter: str, segment_path: str, strategy: str) -> None:
+    """Encode one second (one GOP) of the still image so the render can stream-copy it instead of re-encoding every frame.
+
+    The image is read at 1 fps, so it is decoded and filtered once per second; -r/-vsync cfr then
+    duplicates that frame by reference up to FPS for the encoder.
+    """
+    ffmpeg, _ = ffmpeg_binaries()
+    cmd = [
+        ffmpeg, '-y', '-hide_banner', '-loglevel', 'error',
+        '-loop', '1', '-framerate', '1', '-t', str(STILL_SEGMENT_SECONDS), '-i', image_path,
+        '-vf', video_filter,
+        '-r', str(FPS), '-vsync', 'cfr',
+        *video_codec_args(strategy),
+        '-g', str(FPS * STILL_SEGMENT_SECONDS), '-keyint_min', str(FPS * STILL_SEGMENT_SECONDS),
+        '-pix_fmt', 'yuv420p', '-an',
+        segment_path
+    ]
+    subprocess.run(cmd, capture_output=True, text=True, check=True, timeout=120, env=FFMPEG_ENV)
+
+
+def write_concat_list(segment_path: str, duration: float) -> str:
+    """Write a concat-demuxer list repeating the still segment enough times to cover duration."""
+    list_path = os.path.splitext(segment_path)[0] + ".txt"
+    repeats = math.ceil(duration / STILL_SEGMENT_SECONDS)
+    with open(list_path, 'w') as f:
+        f.write(f"file '{os.path.basename(segment_path)}'\n" * repeats)
+    return list_path
+
+
+def file_to_data_url(path: str, chunk_size: int = 3 * 65536) -> str:
+    """Base64-encode a file into a data URL in 3-byte-aligned chunks instead of one whole-file read."""
+    encoded = bytearray(b"data:video/mp4;base64,")
+    with open(path, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            encoded += base64.b64encode(chunk)
+    return encoded.decode('ascii')
+
+
+def upload_video(output_path: str, job_id: str) -> str:
+    """Upload the render to Cloudinary in 6 MB chunks and return its URL."""
+    r = cloudinary.uploader.upload_large(
+        output_path,
+        resource_type="video",
+        folder="instagram-reels/renders",
+        public_id=f"re_{job_id}",
+        chunk_size=6_000_000,
+    )
+    return r['secure_url']
+
+
+def discard_upload(upload_future, job_id: str) -> None:
+    """Delete an upload that was started for an output which then failed verification."""
+    try:
+        upload_future.result()
+        cloudinary.uploader.destroy(f"instagram-reels/renders/re_{job_id}", resource_type="video")
+    except Exception as e:
+        print(f"Could not discard upload re_{job_id}: {e}")
@@ -1,14 +1,32 @@
 import os
+import collections
+import functools
+import hashlib
 import subprocess
+import threading
 import uuid
 import base64
+from concurrent.futures import ThreadPoolExecutor
 import requests
 import json
 import time
+from email.utils import parsedate_to_datetime
 
 # Version V15 - Production Parity Fix
 # Optimized for: Mixed Video/Image Timelines & Hybrid Mode
 
+# Explicit thread budget for the 4 vCPU render container; x264's auto heuristic (1.5x cores) oversubscribes it
+FFMPEG_THREADS = int(os.environ.get("FFMPEG_THREADS", "4"))
+FFMPEG_LOGLEVEL = os.environ.get("FFMPEG_LOGLEVEL", "error")
+STDERR_TAIL_LINES = 200
+DOWNLOAD_BLOCK_SIZE = 1 << 20
+ASSET_CACHE_DIR = "/cache/assets"
+ASSET_CACHE_MAX_AGE = 7 * 24 * 3600
+SUBS_CACHE_DIR = "/cache/subs"
+SUBTITLE_STYLE = {'Fontname': 'Arial', 'Fontsize': '24', 'PrimaryColour': '&H00FFFFFF'}
+
+_ffmpeg_warm = threading.Event()
+
 def render_video(
     voiceover_url: str = None,
     music_url: str = None,
@@ -25,34 +43,34 @@ def render_video(
     os.makedirs(job_dir, exist_ok=True)
     
     print(f"[FFmpeg] Starting Job {job_id} (V15 - Final)")
+    if not _ffmpeg_warm.is_set():
+        threading.Thread(target=warm_up_ffmpeg, daemon=True).start()
 
+    # Optional assets and CPU-only PIL work overlap with the voiceover/visual downloads
+    prep_pool = ThreadPoolExecutor(max_workers=4)
     try:
         # 1. Download Core Assets
+        black_img = f"{job_dir}/black.png"
+        black_fut = prep_pool.submit(create_black_frame, black_img)
+        music_fut = prep_pool.submit(download_optional, music_url, f"{job_dir}/music.mp3", "Music", cache=True)
+        subtitles_fut = prep_pool.submit(prepare_subtitles, subtitles_url, f"{job_dir}/subtitles.srt")
+        logo_url_active = (branding.get('logoUrl') if branding else None) or logo_url
+        logo_fut = prep_pool.submit(download_optional, logo_url_active, f"{job_dir}/logo.png", "Logo", cache=True)
+
         voiceover_path = download_file(voiceover_url, f"{job_dir}/voiceover.mp3")
         voiceover_duration = get_duration(voiceover_path)
         print(f"[FFmpeg] Voiceover: {voiceover_duration}s")
+        music_bed_fut = prep_pool.submit(lambda: prepare_music_bed(music_fut.result(), f"{job_dir}/music_bed.wav", voiceover_duration))
 
-        music_path = None
-        if music_url:
-            try: music_path = download_file(music_url, f"{job_dir}/music.mp3")
-            except: print("[FFmpeg] Music download failed, skipping music.")
-
-        subtitles_path = None
-        if subtitles_url:
-            try: subtitles_path = download_file(subtitles_url, f"{job_dir}/subtitles.srt")
-            except: print("[FFmpeg] Subtitles download failed, skipping subtitles.")
-
-        logo_path = None
-        logo_url_active = (branding.get('logoUrl') if branding else None) or logo_url
-        if logo_url_active:
-            try: logo_path = download_file(logo_url_active, f"{job_dir}/logo.png")
-            except: print("[FFmpeg] Logo download failed.")
+        logo_path = logo_fut.result()
+        slide_fut = None
+        if branding:
+            slide_path = f"{job_dir}/branding_final.png"
+            slide_fut = prep_pool.submit(create_conclusion_slide, branding, slide_path, logo_path)
 
         # 2. Process Visual Sequences
         visual_inputs = []
-        black_img = f"{job_dir}/black.png"
-        from PIL import Image as PILImage
-        PILImage.new('RGB', (1080, 1920), color='black').save(black_img)
+        black_fut.result()
 
         # Hybrid/Turbo Mode Detection
         active_urls = animated_video_urls or ([animated_video_url] if animated_video_url else [])
@@ -84,16 +102,20 @@ def render_video(
         if not visual_inputs:
             visual_inputs.append({'type': 'image', 'path': black_img, 'duration': voiceover_duration})
 
-        if branding:
-            slide_path = f"{job_dir}/branding_final.png"
-            create_conclusion_slide(branding, slide_path, logo_path)
+        if slide_fut:
+            slide_fut.result()
             visual_inputs.append({'type': 'image', 'path': slide_path, 'duration': 4.0})
 
+        music_bed = music_bed_fut.result()
+        music_path, loop_music = (music_bed, False) if music_bed else (music_fut.result(), True)
+        subtitles_path = subtitles_fut.result()
+
         # 3. Build FFmpeg Command
         output_path = f"{job_dir}/final_output.mp4"
         cmd = build_ffmpeg_command(
             voiceover_path=voiceover_path,
             music_path=music_path,
+            loop_music=loop_music,
             subtitles_path=subtitles_path,
             visual_inputs=visual_inputs,
             logo_path=logo_path,
@@ -103,11 +125,10 @@ def render_video(
         )
 
         print(f"[FFmpeg] Executing: {' '.join(cmd)}")
-        res = subprocess.run(cmd, capture_output=True, text=True, timeout=600)
+        returncode, stderr_tail = run_ffmpeg(cmd, timeout=600)
         
-        if res.returncode != 0:
-            print(f"[FFmpeg] ERR: {res.stderr}")
-            raise Exception(f"FFmpeg render failed: {res.stderr[-500:]}")
+        if returncode != 0:
+            raise Exception(f"FFmpeg render failed: {stderr_tail}")
 
         # 4. Upload Result
         cloudinary_url = os.environ.get("CLOUDINARY_URL")
@@ -121,32 +142,63 @@ def render_video(
                 return {"video_url": f"data:video/mp4;base64,{base64.b64encode(f.read()).decode('utf-8')}", "render_id": job_id}
 
     finally:
+        prep_pool.shutdown(wait=True)
         import shutil
         shutil.rmtree(job_dir, ignore_errors=True)
 
-def build_ffmpeg_command(voiceover_path, music_path, subtitles_path, visual_inputs, logo_path, logo_position, total_duration, output_path):
-    cmd = ['ffmpeg', '-y', '-hide_banner', '-loglevel', 'info']
-    filter_complex = []
+def build_ffmpeg_command(voiceover_path, music_path, subtitles_path, visual_inputs, logo_path, logo_position, total_duration, output_path, loop_music=True):
+    cmd = ['ffmpeg', '-y', '-nostdin', '-hide_banner', '-loglevel', FFMPEG_LOGLEVEL,
+           '-filter_threads', str(FFMPEG_THREADS), '-filter_complex_threads', str(FFMPEG_THREADS)]
     
     # Inputs
     cmd.extend(['-i', voiceover_path]) # Index 0
-    v_start = 1
     if music_path:
-        cmd.extend(['-stream_loop', '-1', '-i', music_path]) # Index 1
-        v_start = 2
+        cmd.extend(['-stream_loop', '-1', '-i', music_path] if loop_music else ['-i', music_path]) # Index 1
     
+    for vis in visual_inputs:
+        cmd.extend(['-loop', '1', '-t', str(vis['duration']), '-i', vis['path']]) if vis['type'] == 'image' else cmd.extend(['-i', vis['path']])
+
+    # Filter graph: cached skeleton per timeline shape, only per-job values substituted
+    subs_filter = None if not subtitles_path else ('ass' if subtitles_path.endswith('.ass') else 'subtitles')
+    template = _graph_template(tuple(vis['type'] for vis in visual_inputs), bool(music_path), subs_filter)
+    frames = {f"frames_{i}": int(vis['duration'] * 24) for i, vis in enumerate(visual_inputs)}
+    filter_complex = template.format(subs=subtitles_path, **frames)
+
+    v_tag = "v_burned" if subtitles_path else "v_base"
+    a_tag = "a_mix" if music_path else "a_norm"
+    cmd.extend(['-filter_complex', filter_complex])
+    cmd.extend(['-map', f'[{v_tag}]', '-map', f'[{a_tag}]'])
+    cmd.extend(['-threads', str(FFMPEG_THREADS), '-x264-params', f'threads={FFMPEG_THREADS}:sliced-threads=1:lookahead-threads=1'])
+    cmd.extend(['-t', str(total_duration), '-c:v', 'libx264', *x264_tuning(visual_inputs), '-maxrate', '2M', '-bufsize', '4M'])
+    cmd.extend(['-c:a', 'aac', '-ac', '2', '-pix_fmt', 'yuv420p', '-movflags', '+faststart', output_path])
+    return cmd
+
+def x264_tuning(visual_inputs):
+    """
+    x264 speed settings for the timeline. Both presets keep motion search (diamond, one reference);
+    ultrafast additionally drops CABAC, B-frames, deblocking and adaptive quantization, which the
+    zoompan stills tolerate but cut video clips show. -tune stillimage only lowers the deblock
+    offsets and raises psy-rd/AQ strength, none of which turns motion estimation off.
+    """
+    if all(vis['type'] == 'image' for vis in visual_inputs):
+        return ['-preset', 'ultrafast', '-tune', 'stillimage']
+    return ['-preset', 'superfast']
+
+@functools.lru_cache(maxsize=64)
+def _graph_template(visual_types, has_music, subs_filter):
+    """Filter graph for one timeline shape, with `{frames_i}` / `{subs}` fields left for str.format."""
+    filter_complex = []
+    v_start = 2 if has_music else 1
+
     vis_norm_tags = []
-    for i, vis in enumerate(visual_inputs):
+    for i, vis_type in enumerate(visual_types):
         in_tag = f'[{v_start+i}:v]'
         out_tag = f'v_norm_{i}'
         vis_norm_tags.append(f'[{out_tag}]')
         
-        cmd.extend(['-loop', '1', '-t', str(vis['duration']), '-i', vis['path']]) if vis['type'] == 'image' else cmd.extend(['-i', vis['path']])
-        
-        if vis['type'] == 'image':
-            num_frames = int(vis['duration'] * 24)
+        if vis_type == 'image':
             norm = (f"{in_tag}scale=1280:2276:force_original_aspect_ratio=increase,crop=1280:2276,"
-                    f"zoompan=z='min(zoom+0.0015,1.5)':d={num_frames}:x='iw/2-(iw/zoom/2)':y='ih/2-(ih/zoom/2)':s=1080x1920,"
+                    f"zoompan=z='min(zoom+0.0015,1.5)':d={{frames_{i}}}:x='iw/2-(iw/zoom/2)':y='ih/2-(ih/zoom/2)':s=1080x1920,"
                     f"setpts=PTS-STARTPTS,format=yuv420p[{out_tag}]")
         else:
             norm = (f"{in_tag}scale=1080:1920:force_original_aspect_ratio=decrease,pad=1080:1920:(ow-iw)/2:(oh-ih)/2,"
@@ -155,45 +207,158 @@ def build_ffmpeg_command(voiceover_path, music_path, subtitles_path, visual_inpu
 
     # Concat
     concat_str = "".join(vis_norm_tags)
-    filter_complex.append(f"{concat_str}concat=n={len(visual_inputs)}:v=1:a=0[v_base]")
-    v_tag = "v_base"
+    filter_complex.append(f"{concat_str}concat=n={len(visual_types)}:v=1:a=0[v_base]")
 
-    # Subtitles
-    if subtitles_path:
-        filter_complex.append(f"[{v_tag}]subtitles={subtitles_path}:force_style='FontName=Arial,FontSize=24,PrimaryColour=&H00FFFFFF'[v_burned]")
-        v_tag = "v_burned"
+    # Subtitles: pre-styled ASS skips libass's SRT conversion; raw SRT is the fallback
+    if subs_filter == 'ass':
+        filter_complex.append("[v_base]ass={subs}[v_burned]")
+    elif subs_filter:
+        filter_complex.append("[v_base]subtitles={subs}:force_style='FontName=Arial,FontSize=24,PrimaryColour=&H00FFFFFF'[v_burned]")
 
     # Audio Mix
-    if music_path:
+    if has_music:
         filter_complex.append(f"[0:a]aresample=44100,volume=2.0,asplit=2[vo_side][vo_main]")
         filter_complex.append(f"[1:a]aresample=44100,volume=0.4[bg]")
         filter_complex.append(f"[bg][vo_side]sidechaincompress=threshold=0.15:ratio=3:attack=50:release=600[bg_duck]")
         filter_complex.append(f"[vo_main][bg_duck]amix=inputs=2:duration=first[a_mix]")
-        a_tag = "a_mix"
     else:
         filter_complex.append(f"[0:a]aresample=44100,volume=2.0[a_norm]")
-        a_tag = "a_norm"
 
-    cmd.extend(['-filter_complex', ';'.join(filter_complex)])
-    cmd.extend(['-map', f'[{v_tag}]', '-map', f'[{a_tag}]'])
-    cmd.extend(['-t', str(total_duration), '-c:v', 'libx264', '-preset', 'veryfast', '-c:a', 'aac', '-ac', '2', '-pix_fmt', 'yuv420p', '-movflags', '+faststart', output_path])
-    return cmd
+    return ';'.join(filter_complex)
+
+def download_optional(url, dest, label, **kwargs):
+    if not url: return None
+    try: return download_file(url, dest, **kwargs)
+    except: print(f"[FFmpeg] {label} download failed, skipping {label.lower()}.")
+
+def prepare_subtitles(url, dest):
+    subtitles_path = download_optional(url, dest, "Subtitles")
+    if not subtitles_path: return None
+    try: return convert_subtitles_to_ass(subtitles_path)
+    except Exception as e:
+        print(f"[FFmpeg] ASS conversion failed, burning SRT directly: {e}")
+        return subtitles_path
+
+def prepare_music_bed(music_path, output_path, duration):
+    """Loop/trim the music once to a PCM bed of `duration` seconds so the render decodes no looped mp3."""
+    if not music_path: return None
+    cmd = ['ffmpeg', '-y', '-nostdin', '-loglevel', 'error', '-threads', '1', '-stream_loop', '-1', '-i', music_path,
+           '-t', str(duration), '-ar', '44100', '-c:a', 'pcm_s16le', output_path]
+    try:
+        subprocess.run(cmd, capture_output=True, check=True, timeout=120)
+        return output_path
+    except Exception as e:
+        print(f"[FFmpeg] Music pre-loop failed, looping in render: {e}")
+
+def create_black_frame(output_path):
+    from PIL import Image as PILImage
+    PILImage.new('RGB', (1080, 1920), color='black').save(output_path)
+
+def run_ffmpeg(cmd, timeout):
+    """Run ffmpeg, forwarding stderr line by line; returns (returncode, last STDERR_TAIL_LINES lines of stderr)."""
+    tail = collections.deque(maxlen=STDERR_TAIL_LINES)
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, bufsize=1)
+
+    def consume_stderr():
+        for line in proc.stderr:
+            tail.append(line.rstrip())
+            print(f"[FFmpeg] {tail[-1]}")
+
+    reader = threading.Thread(target=consume_stderr, daemon=True)
+    reader.start()
+    try:
+        proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+        raise
+    finally:
+        reader.join()
+    return proc.returncode, "\n".join(tail)
+
+def warm_up_ffmpeg():
+    """Encode one tiny frame so ffmpeg and libx264 are paged in while the first job is still downloading."""
+    _ffmpeg_warm.set()
+    cmd = ['ffmpeg', '-nostdin', '-hide_banner', '-loglevel', 'error', '-f', 'lavfi', '-i', 'color=c=black:s=64x64:d=0.1',
+           '-c:v', 'libx264', '-preset', 'veryfast', '-f', 'null', '-']
+    try: subprocess.run(cmd, capture_output=True, timeout=30)
+    except Exception as e: print(f"[FFmpeg] Warm-up skipped: {e}")
 
 def get_duration(file_path):
-    cmd = ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1', file_path]
-    return float(subprocess.run(cmd, capture_output=True, text=True, check=True).stdout.strip())
+    cmd = ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'json', file_path]
+    return float(json.loads(subprocess.run(cmd, capture_output=True, text=True, check=True).stdout)["format"]["duration"])
+
+def convert_subtitles_to_ass(srt_path):
+    """Convert SRT to ASS once per subtitle content, with SUBTITLE_STYLE baked into the Default style."""
+    with open(srt_path, 'rb') as f: digest = hashlib.sha1(f.read()).hexdigest()
+    ass_path = f"{SUBS_CACHE_DIR}/{digest}.ass"
+    if os.path.exists(ass_path): return ass_path
+    os.makedirs(SUBS_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{ass_path}.{uuid.uuid4().hex[:8]}.tmp"
+    subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', '-threads', '1', '-i', srt_path, '-f', 'ass', tmp_path], capture_output=True, check=True)
+    with open(tmp_path, encoding='utf-8') as f: lines = f.read().splitlines()
+    with open(tmp_path, 'w', encoding='utf-8') as f: f.write("\n".join(apply_ass_style(lines, SUBTITLE_STYLE)) + "\n")
+    os.replace(tmp_path, ass_path)
+    return ass_path
+
+def apply_ass_style(lines, overrides):
+    """Override named fields of the Default style in ASS script lines (like libass force_style)."""
+    fields, out = None, []
+    for line in lines:
+        if line.startswith('Format:') and fields is None and 'Fontname' in line:
+            fields = [name.strip() for name in line[len('Format:'):].split(',')]
+        elif line.startswith('Style: Default,') and fields:
+            values = line[len('Style: '):].split(',')
+            for name, value in overrides.items():
+                if name in fields: values[fields.index(name)] = value
+            line = 'Style: ' + ','.join(values)
+        out.append(line)
+    return out
 
-def download_file(url, dest):
+def download_file(url, dest, cache=False):
     if not url or url == "undefined": raise ValueError(f"Invalid URL: {url}")
     if url.startswith('data:'):
         _, data = url.split(',', 1)
         with open(dest, 'wb') as f: f.write(base64.b64decode(data))
         return dest
-    r = requests.get(url, timeout=30)
-    r.raise_for_status()
-    with open(dest, 'wb') as f: f.write(r.content)
+    if cache: return link_cached_asset(url, dest)
+    fetch_to_file(url, dest)
     return dest
 
+def fetch_to_file(url, dest):
+    with requests.get(url, timeout=30, stream=True) as r:
+        r.raise_for_status()
+        # Unbuffered 1 MiB writes: one write(2) per block, no full-body copy held in memory
+        with open(dest, 'wb', buffering=0) as f:
+            for chunk in r.iter_content(chunk_size=DOWNLOAD_BLOCK_SIZE): f.write(chunk)
+
+def link_cached_asset(url, dest):
+    """Serve repeat URLs (music, logos) from the content-addressed /cache/assets store, symlinked into the job dir."""
+    digest = hashlib.blake2b(url.encode(), digest_size=16).hexdigest()
+    cached = f"{ASSET_CACHE_DIR}/{digest}{os.path.splitext(dest)[1]}"
+    if not is_cached_asset_fresh(url, cached):
+        os.makedirs(ASSET_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{cached}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            fetch_to_file(url, tmp_path)
+            os.replace(tmp_path, cached)
+        finally:
+            if os.path.exists(tmp_path): os.remove(tmp_path)
+    os.symlink(cached, dest)
+    return dest
+
+def is_cached_asset_fresh(url, cached):
+    """Fresh if younger than ASSET_CACHE_MAX_AGE, or if a HEAD shows the origin unchanged since it was cached."""
+    if not os.path.exists(cached): return False
+    if time.time() - os.path.getmtime(cached) < ASSET_CACHE_MAX_AGE: return True
+    try:
+        r = requests.head(url, timeout=10, allow_redirects=True)
+        last_modified = r.headers.get('Last-Modified')
+        if not r.ok or not last_modified or parsedate_to_datetime(last_modified).timestamp() > os.path.getmtime(cached): return False
+    except Exception: return False
+    os.utime(cached)
+    return True
+
 def create_conclusion_slide(branding, output_path, logo_path):
     from PIL import Image, ImageDraw, ImageFont
     W, H = 1080, 1920
@@ -0,0 +1,108 @@
+"""
+Shared runtime setup for the Beam GPU model endpoints (FLUX, SDXL, Mochi, HunyuanVideo, web classifier).
+
+The endpoint modules import this at module level, so nothing here may import torch,
+diffusers or transformers at import time: `beam deploy` loads the endpoint modules
+on machines without the ML stack installed.
+"""
+
+import os
+import random
+from io import BytesIO
+
+# Grow segments in place, keep large cached blocks splittable, reclaim before OOM
+CUDA_ALLOC_CONF = "expandable_segments:True,max_split_size_mb:512,garbage_collection_threshold:0.9"
+
+
+def configure_runtime(cache_dir: str = None, compile_cache: bool = False) -> None:
+    """
+    Process-wide environment and torch backend settings for a model loader.
+
+    Call it first thing in the loader: the allocator config only applies if it is set
+    before CUDA initialises, and huggingface_hub reads the HF_* variables when it is
+    first imported, so diffusers/transformers must be imported after this returns.
+    """
+    if cache_dir:
+        os.environ["HF_HOME"] = cache_dir
+        os.environ["TRANSFORMERS_CACHE"] = cache_dir
+        os.environ["HF_HUB_DISABLE_TELEMETRY"] = "1"
+        if compile_cache:
+            # Compiled Inductor kernels and their autotuning results live on the volume, so cold containers reuse them
+            os.environ["TORCHINDUCTOR_CACHE_DIR"] = f"{cache_dir}/torchinductor"
+    os.environ["PYTORCH_CUDA_ALLOC_CONF"] = CUDA_ALLOC_CONF
+
+    import torch
+
+    # TF32 matmuls/convolutions (Ampere and newer) and cuDNN autotuning for the fixed request shapes
+    torch.backends.cudnn.benchmark = True
+    torch.backends.cuda.matmul.allow_tf32 = True
+    torch.backends.cudnn.allow_tf32 = True
+    torch.set_float32_matmul_precision("high")
+
+
+def from_pretrained_cached(model_cls, *args, **kwargs):
+    """from_pretrained straight from the local cache snapshot, skipping Hub metadata requests; downloads only if it is missing."""
+    try:
+        return model_cls.from_pretrained(*args, local_files_only=True, **kwargs)
+    except OSError:
+        print(f"[{model_cls.__name__}] {args[0]} not in the local cache, downloading")
+        return model_cls.from_pretrained(*args, **kwargs)
+
+
+def save_image(image, buffer, image_format: str = "webp") -> str:
+    """Encode the image into buffer and return its MIME type. WEBP by default; PNG only when a caller asks for it."""
+    fmt = image_format.lower()
+    if fmt == "webp":
+        image.save(buffer, format="WEBP", quality=92, method=4)
+    elif fmt in ("jpeg", "jpg"):
+        fmt = "jpeg"
+        image.save(buffer, format="JPEG", quality=92)
+    elif fmt == "png":
+        image.save(buffer, format="PNG")
+    else:
+        raise ValueError(f"Unsupported image_format: {image_format}")
+    return f"image/{fmt}"
+
+
+def make_generators(pipe, count: int = 1) -> None:
+    """Attach count CUDA generators to pipe, created once per container and re-seeded per request."""
+    import torch
+
+    pipe._generators = [torch.Generator("cuda") for _ in range(count)]
+
+
+def resolve_seed(seed: int = None) -> int:
+    """The caller's seed, or a fresh random one that is returned to the caller so the output can be reproduced."""
+    return seed if seed is not None else random.getrandbits(63)
+
+
+def seeded_generators(pipe, seed: int, count: int = 1):
+    """pipe's generators re-seeded to seed, seed + 1, ...: one per image, a bare generator when count is 1."""
+    generators = [generator.manual_seed(seed + i) for i, generator in enumerate(pipe._generators[:count])]
+    return generators[0] if count == 1 else generators
+
+
+def prompt_batches(prompts: list, batch_size: int, pad: bool = False):
+    """
+    Yield (start, batch, call_prompts) for each batch_size slice of prompts.
+
+    With pad, a short last batch is filled with repeats of its final prompt so a compiled
+    model only ever sees the batch sizes it was warmed at; callers keep the first len(batch) outputs.
+    """
+    for start in range(0, len(prompts), batch_size):
+        batch = prompts[start:start + batch_size]
+        yield start, batch, (batch + [batch[-1]] * (batch_size - len(batch)) if pad else batch)
+
+
+def to_data_url(data, mime_type: str) -> str:
+    """Base64 data URL for raw bytes (or any buffer)."""
+    import pybase64
+
+    return f"data:{mime_type};base64,{pybase64.b64encode(data).decode('ascii')}"
+
+
+def image_data_url(image, image_format: str = "webp") -> str:
+    """Encode a PIL image with save_image and return it as a data URL."""
+    buffer = BytesIO()
+    mime_type = save_image(image, buffer, image_format)
+    return to_data_url(buffer.getbuffer(), mime_type)
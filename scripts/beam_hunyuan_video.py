@@ -5,14 +5,16 @@ Generates videos using Tencent's HunyuanVideo open-source model.
 Runs on H100 GPU (80GB VRAM required).
 
 Deploy with:
-    beam deploy beam_hunyuan_video.py:generate_video
+    beam deploy scripts/beam_hunyuan_video.py:generate_video
 """
 
 from beam import endpoint, Image, Volume
 import os
 import subprocess
+import time
 import uuid
-import base64
+
+from scripts.beam_gpu_core import configure_runtime
 
 
 # Use the official HunyuanVideo Docker image with CUDA 12
@@ -21,6 +23,12 @@ image = Image(
     base_image="hunyuanvideo/hunyuanvideo:cuda_12",
     python_packages=[
         "cloudinary",
+        "diffusers>=0.33.0",
+        "transformers>=4.45.0",
+        "accelerate",
+        "imageio",
+        "imageio-ffmpeg",
+        "pybase64",
     ],
 )
 
@@ -28,6 +36,43 @@ image = Image(
 model_volume = Volume(name="hunyuan-video-models", mount_path="/models")
 cache_volume = Volume(name="hunyuan-video-cache", mount_path="/cache")
 
+# Diffusers-format weights, downloaded by the prewarm endpoint
+MODEL_REPO = "hunyuanvideo-community/HunyuanVideo"
+MODEL_DIR = "/models/hunyuan-video-diffusers"
+
+NUM_INFERENCE_STEPS = 30
+GENERATION_TIMEOUT = 1500  # 25 min, leaves headroom under the endpoint's 30 min timeout
+
+
+def load_hunyuan():
+    """Load the HunyuanVideo pipeline once at container startup and keep it resident on the GPU."""
+    import torch
+    
+    configure_runtime()
+    from diffusers import HunyuanVideoPipeline, HunyuanVideoTransformer3DModel
+    
+    if not os.path.exists(f"{MODEL_DIR}/model_index.json"):
+        print("[HunyuanVideo] Weights not on volume yet; run the prewarm endpoint")
+        return None
+    
+    print("[HunyuanVideo] Loading pipeline at container startup...")
+    
+    transformer = HunyuanVideoTransformer3DModel.from_pretrained(
+        MODEL_DIR, subfolder="transformer", torch_dtype=torch.bfloat16
+    )
+    # FP8 weight storage with bf16 compute, the in-process equivalent of --flow-weight-precision fp8
+    transformer.enable_layerwise_casting(storage_dtype=torch.float8_e4m3fn, compute_dtype=torch.bfloat16)
+    
+    pipe = HunyuanVideoPipeline.from_pretrained(
+        MODEL_DIR, transformer=transformer, torch_dtype=torch.float16
+    )
+    pipe.to("cuda")
+    pipe.vae.enable_tiling()
+    pipe.set_progress_bar_config(disable=True)
+    
+    print("[HunyuanVideo] Pipeline loaded!")
+    return pipe
+
 
 @endpoint(
     name="hunyuan-video",
@@ -38,9 +83,11 @@ cache_volume = Volume(name="hunyuan-video-cache", mount_path="/cache")
     timeout=1800,  # 30 minutes max
     volumes=[model_volume, cache_volume],
     keep_warm_seconds=3600,  # Keep warm for 1 hour to ensure zero-latency for production sessions
+    on_start=load_hunyuan,
     secrets=["CLOUDINARY_URL"],
 )
 def generate_video(
+    context,
     prompt: str,
     duration_seconds: float = 5.0,
     width: int = 720,
@@ -50,48 +97,41 @@ def generate_video(
 ) -> dict:
     """
     Generate a video using HunyuanVideo.
+    
+    The VAE compresses time 4x, so the frame count is snapped to the nearest 4k + 1
+    (clamped to 5-129) rather than taken verbatim from duration_seconds * fps.
     """
+    import torch
+    from diffusers.utils import export_to_video
+    
+    pipe = context.on_start_value
     job_id = str(uuid.uuid4())[:8]
     output_dir = f"/cache/generation_{job_id}"
     os.makedirs(output_dir, exist_ok=True)
     
     try:
         # Check if models are available. If not, FAIL FAST instead of hanging for 15 minutes.
-        if not os.path.exists("/models/ckpts/hunyuan-video-t2v-720p"):
+        if pipe is None:
             raise Exception("Model weights missing. Please run the 'prewarm' endpoint first to cache 30GB models to the persistent volume.")
 
-        print(f"[HunyuanVideo] Job {job_id}: Starting generation...")
+        num_frames = min(max(4 * round((duration_seconds * fps - 1) / 4) + 1, 5), 129)
+        print(f"[HunyuanVideo] Job {job_id}: Starting generation ({num_frames} frames)...")
         
-        # Command for HunyuanVideo official sample script
-        # We use fp8 for flow weights to fit into H100 and maintain speed
-        cmd = [
-            "python3", "sample_video.py",
-            "--prompt", prompt,
-            "--video-size", str(height), str(width),
-            "--video-length", "129", # Standard for ~5s clips
-            "--infer-steps", "30",
-            "--save-path", output_dir,
-            "--model-path", "/models/ckpts",
-            "--flow-weight-precision", "fp8",
-            "--text-states-precision", "fp16",
-        ]
-
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=1500,  # 25 min timeout for generation
-            cwd="/workspace/HunyuanVideo"
-        )
+        # Seed the default CUDA generator once rather than threading a per-request Generator through the sampler
+        torch.cuda.manual_seed_all(seed if seed is not None else 42)
+        progress = progress_callback(job_id, NUM_INFERENCE_STEPS, time.monotonic() + GENERATION_TIMEOUT)
+        with torch.inference_mode():
+            frames = pipe(
+                prompt=prompt,
+                height=height,
+                width=width,
+                num_frames=num_frames,
+                num_inference_steps=NUM_INFERENCE_STEPS,
+                callback_on_step_end=progress,
+            ).frames[0]
         
-        if result.returncode != 0:
-            print(f"[HunyuanVideo] STDERR: {result.stderr[-2000:]}")
-            raise Exception(f"HunyuanVideo generation failed: {result.stderr[-500:]}")
-        
-        # Find the output video file
-        video_path = find_output_video(output_dir)
-        if not video_path:
-            raise Exception("No video file generated")
+        video_path = f"{output_dir}/{job_id}.mp4"
+        export_to_video(frames, video_path, fps=fps)
         
         print(f"[HunyuanVideo] Video generated: {video_path}")
         
@@ -108,7 +148,7 @@ def generate_video(
             "video_url": video_url,
             "job_id": job_id,
             "prompt": prompt,
-            "duration_seconds": duration_seconds,
+            "duration_seconds": num_frames / fps,
             "width": width,
             "height": height,
         }
@@ -135,35 +175,31 @@ def prewarm():
 
 def download_models():
     """Download HunyuanVideo model weights to persistent volume."""
-    os.makedirs("/models/ckpts", exist_ok=True)
+    os.makedirs(MODEL_DIR, exist_ok=True)
     
     # Use huggingface-cli to download models
     # Increased timeout to 1 hour as weights are ~30GB
     subprocess.run([
         "huggingface-cli", "download",
-        "tencent/HunyuanVideo",
-        "--local-dir", "/models/ckpts",
+        MODEL_REPO,
+        "--local-dir", MODEL_DIR,
     ], check=True, timeout=3600)
     
     print("[HunyuanVideo] Models downloaded successfully")
 
 
-def find_output_video(output_dir: str) -> str:
-    """Find the generated video file in the output directory."""
-    import glob
-    
-    # HunyuanVideo outputs MP4 files
-    patterns = [
-        f"{output_dir}/*.mp4",
-        f"{output_dir}/**/*.mp4",
-    ]
+def progress_callback(job_id: str, num_steps: int, deadline: float):
+    """Per-step callback that logs sampler progress and aborts once the generation deadline has passed."""
+    started = time.monotonic()
     
-    for pattern in patterns:
-        files = glob.glob(pattern, recursive=True)
-        if files:
-            return files[0]
+    def on_step_end(pipe, step, timestep, callback_kwargs):
+        now = time.monotonic()
+        print(f"[HunyuanVideo] Job {job_id}: step {step + 1}/{num_steps} ({now - started:.0f}s)")
+        if now > deadline:
+            raise TimeoutError(f"HunyuanVideo generation exceeded {GENERATION_TIMEOUT}s at step {step + 1}/{num_steps}")
+        return callback_kwargs
     
-    return None
+    return on_step_end
 
 
 def upload_to_cloudinary(file_path: str, job_id: str, cloudinary_url: str) -> str:
@@ -171,16 +207,19 @@ def upload_to_cloudinary(file_path: str, job_id: str, cloudinary_url: str) -> st
     import cloudinary.uploader
     cloudinary.config(cloudinary_url=cloudinary_url)
     
-    result = cloudinary.uploader.upload(
+    # Chunked upload: 6 MB requests instead of the whole file in one body
+    result = cloudinary.uploader.upload_large(
         file_path,
         resource_type="video",
         folder="instagram-reels/hunyuan",
-        public_id=f"hv_{job_id}"
+        public_id=f"hv_{job_id}",
+        chunk_size=6_000_000,
     )
     return result['secure_url']
 
 
 def file_to_data_uri(file_path: str) -> str:
     """Convert file to base64 data URI (fallback if no Cloudinary)."""
+    import pybase64
     with open(file_path, 'rb') as f:
-        return f"data:video/mp4;base64,{base64.b64encode(f.read()).decode('utf-8')}"
+        return f"data:video/mp4;base64,{pybase64.b64encode(f.read()).decode('ascii')}"
@@ -5,11 +5,13 @@ Mochi 1 is an open-source text-to-video model from Genmo.
 Generates ~3-6 second video clips.
 
 Deploy with:
-    beam deploy beam_mochi_video.py:generate_video
+    beam deploy scripts/beam_mochi_video.py:generate_video
 """
 
 from beam import endpoint, Image, Volume
 
+from scripts.beam_gpu_core import configure_runtime, from_pretrained_cached, make_generators, seeded_generators, to_data_url
+
 image = Image(
     python_version="python3.10",
     python_packages=[
@@ -18,52 +20,66 @@ image = Image(
         "transformers",
         "accelerate",
         "safetensors",
-        "imageio",
-        "imageio-ffmpeg",
+        "imageio>=2.28",
+        "av",
         "huggingface_hub",
+        "pybase64",
     ],
 )
 
 model_volume = Volume(name="mochi-model-cache", mount_path="/cache")
 
+# Sampling parameters per backend; load_model records which one it loaded on pipe.backend
+BACKEND_PARAMS = {
+    # Mochi's VAE compresses time 6x, so frame counts are snapped to 6k + 1
+    "mochi": {"fps": 8, "max_frames": 49, "frame_stride": 6, "num_inference_steps": 30, "guidance_scale": 6.0},
+    # CogVideoX-2B is trained on exactly 49 frames at 8 fps and 720x480
+    "cogvideox": {"fps": 8, "max_frames": 49, "frame_stride": None, "num_inference_steps": 50, "guidance_scale": 6.0},
+}
+
 
 def load_model():
     """Load Mochi model at container startup."""
-    import os
     import torch
     
-    os.environ["HF_HOME"] = "/cache"
-    os.environ["TRANSFORMERS_CACHE"] = "/cache"
+    configure_runtime("/cache")
     
     print("[Mochi] Loading model...")
     
+    from diffusers import MochiPipeline
+    from huggingface_hub.utils import GatedRepoError, RepositoryNotFoundError
+    
+    # Only a model that is genuinely unavailable on the Hub falls back to CogVideoX; transient
+    # network or CUDA errors fail the container start so Beam retries it with Mochi.
+    # diffusers re-raises Hub errors as OSError, so the Hub error is its cause
     try:
-        from diffusers import MochiPipeline
-        
-        pipe = MochiPipeline.from_pretrained(
+        pipe = from_pretrained_cached(
+            MochiPipeline,
             "genmo/mochi-1-preview",
             torch_dtype=torch.bfloat16,
             cache_dir="/cache",
         )
-        pipe = pipe.to("cuda")
-        pipe.enable_model_cpu_offload()  # Save VRAM
-        
-        print("[Mochi] Model loaded!")
-        return pipe
-    except Exception as e:
-        print(f"[Mochi] Failed to load Mochi, trying CogVideoX fallback: {e}")
+        pipe.backend = "mochi"
+    except OSError as e:
+        if not isinstance(e.__cause__ or e.__context__, (GatedRepoError, RepositoryNotFoundError)):
+            raise
+        print(f"[Mochi] Mochi unavailable on the Hub, using CogVideoX fallback: {e}")
         from diffusers import CogVideoXPipeline
         
-        pipe = CogVideoXPipeline.from_pretrained(
+        pipe = from_pretrained_cached(
+            CogVideoXPipeline,
             "THUDM/CogVideoX-2B",
             torch_dtype=torch.bfloat16,
             cache_dir="/cache",
         )
-        pipe = pipe.to("cuda")
-        pipe.enable_model_cpu_offload()
-        
-        print("[CogVideoX] Fallback model loaded!")
-        return pipe
+        pipe.backend = "cogvideox"
+    
+    pipe = pipe.to("cuda")
+    pipe.enable_model_cpu_offload()  # Save VRAM
+    make_generators(pipe)
+    
+    print(f"[{pipe.backend}] Model loaded!")
+    return pipe
 
 
 @endpoint(
@@ -82,17 +98,20 @@ def generate_video(
     prompt: str,
     duration_seconds: int = 5,
     aspect_ratio: str = "9:16",
+    seed: int = None,
 ) -> dict:
     """Generate video using Mochi or CogVideoX."""
-    import torch
-    import base64
-    import tempfile
-    import imageio
+    import numpy as np
+    import imageio.v3 as iio
     
     pipe = context.on_start_value
+    params = BACKEND_PARAMS[pipe.backend]
+    fps = params["fps"]
     
     # Determine dimensions
-    if aspect_ratio == "9:16":
+    if pipe.backend == "cogvideox":
+        width, height = 720, 480  # the only resolution CogVideoX-2B supports; cropped to aspect_ratio below
+    elif aspect_ratio == "9:16":
         width, height = 480, 848
     elif aspect_ratio == "16:9":
         width, height = 848, 480
@@ -100,38 +119,54 @@ def generate_video(
         width, height = 512, 512
     
     # Generate frames
-    num_frames = min(duration_seconds * 8, 48)  # ~8 fps, max 48 frames
+    if params["frame_stride"]:
+        stride = params["frame_stride"]
+        num_frames = min(max(stride * round((duration_seconds * fps - 1) / stride) + 1, stride + 1), params["max_frames"])
+    else:
+        num_frames = params["max_frames"]
     
     enhanced_prompt = f"{prompt}. High quality, smooth motion, cinematic."
     
-    print(f"[VideoGen] Generating {num_frames} frames: '{enhanced_prompt[:60]}...'")
+    print(f"[VideoGen] {pipe.backend}: generating {num_frames} frames: '{enhanced_prompt[:60]}...'")
     
     result = pipe(
         prompt=enhanced_prompt,
         num_frames=num_frames,
         height=height,
         width=width,
-        num_inference_steps=30,
-        guidance_scale=6.0,
-        generator=torch.Generator("cuda").manual_seed(42),
+        num_inference_steps=params["num_inference_steps"],
+        guidance_scale=params["guidance_scale"],
+        generator=seeded_generators(pipe, seed if seed is not None else 42),
     )
     
     frames = result.frames[0]
+    video = np.stack([np.asarray(frame) for frame in frames])
+    if pipe.backend == "cogvideox":
+        # Center-crop the landscape clip so 9:16 requests still get a portrait video to scale up
+        x, y, width, height = crop_box(width, height, aspect_ratio)
+        video = video[:, y:y + height, x:x + width]
     
-    # Save to temporary file
-    with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as f:
-        video_path = f.name
-    
-    imageio.mimsave(video_path, frames, fps=8, codec="libx264")
-    
-    # Read and encode
-    with open(video_path, "rb") as f:
-        video_base64 = base64.b64encode(f.read()).decode("utf-8")
+    # Encode straight into memory; no temp file to write, re-read and clean up
+    video_bytes = iio.imwrite(
+        "<bytes>", video,
+        extension=".mp4", plugin="pyav", codec="libx264", fps=fps,
+    )
     
     print(f"[VideoGen] Video generated ({len(frames)} frames)")
     
     return {
-        "video_base64": f"data:video/mp4;base64,{video_base64}",
-        "duration_seconds": len(frames) / 8,
+        "video_base64": to_data_url(video_bytes, "video/mp4"),
+        "duration_seconds": len(frames) / fps,
         "frame_count": len(frames),
+        "width": width,
+        "height": height,
+        "backend": pipe.backend,
     }
+
+
+def crop_box(width: int, height: int, aspect_ratio: str) -> tuple:
+    """(x, y, w, h) of the largest centered aspect_ratio box inside width x height, with even sides for yuv420p."""
+    ratio_w, ratio_h = (9, 16) if aspect_ratio == "9:16" else (16, 9) if aspect_ratio == "16:9" else (1, 1)
+    crop_w = min(width, height * ratio_w // ratio_h) // 2 * 2
+    crop_h = min(height, width * ratio_h // ratio_w) // 2 * 2
+    return (width - crop_w) // 2, (height - crop_h) // 2, crop_w, crop_h
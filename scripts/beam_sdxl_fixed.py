@@ -5,11 +5,17 @@ Key fix: Use a loader class to load the model ONCE at container startup,
 not on every request. This is the standard pattern for large ML models.
 
 Deploy with:
-    beam deploy beam_sdxl_fixed.py:generate_image
+    beam deploy scripts/beam_sdxl_fixed.py:generate_image
 """
 
+from typing import List, Union
+
 from beam import endpoint, Image, Volume, env
 
+from scripts.beam_gpu_core import (
+    configure_runtime, image_data_url, make_generators, prompt_batches, resolve_seed, seeded_generators,
+)
+
 # Use a pre-built image with CUDA
 image = Image(
     python_version="python3.10",
@@ -20,21 +26,28 @@ image = Image(
         "accelerate==0.24.0",
         "safetensors",
         "Pillow",
+        "pybase64",
     ],
 )
 
 model_volume = Volume(name="sdxl-turbo-cache", mount_path="/cache")
 
+# (width, height) for the 9:16, 16:9 and 1:1 aspect ratios served below
+WARMUP_SHAPES = [(576, 1024), (1024, 576), (768, 768)]
+
+# Prompts per pipeline call when a list is sent; 4 at 576x1024 fits the A10G
+MAX_BATCH_SIZE = 4
+
 
 def load_models():
     """Called once when the container starts. Load model into GPU memory."""
     import os
     import torch
-    from diffusers import AutoPipelineForText2Image
     
-    os.environ["HF_HOME"] = "/cache"
-    os.environ["TRANSFORMERS_CACHE"] = "/cache"
+    configure_runtime("/cache", compile_cache=True)
     os.environ["HF_TOKEN"] = env.get("HF_TOKEN", "")
+    # Imported after configure_runtime, which sets the HF_* variables huggingface_hub reads at import time
+    from diffusers import AutoPipelineForText2Image
     
     print("[SDXL-Turbo] Loading model at container startup...")
     
@@ -47,6 +60,19 @@ def load_models():
     )
     pipe = pipe.to("cuda")
     pipe.set_progress_bar_config(disable=True)
+    make_generators(pipe, MAX_BATCH_SIZE)
+    
+    # The UNet is almost all of a 4-step request; compile it (and the VAE decode) and pay
+    # the compile here with a warmup pass rather than on the first real request
+    pipe.unet = torch.compile(pipe.unet, mode="reduce-overhead", fullgraph=False)
+    pipe.vae.decode = torch.compile(pipe.vae.decode, mode="reduce-overhead")
+    # Warm every advertised resolution at the served step count and at both batch sizes requests
+    # run at, twice each: CUDA graphs are recorded on a compiled function's second call, and the
+    # VAE decode runs only once per pass
+    for width, height in WARMUP_SHAPES:
+        for batch_size in (1, MAX_BATCH_SIZE):
+            for _ in range(2):
+                pipe(["warmup"] * batch_size, num_inference_steps=4, guidance_scale=0.0, width=width, height=height)
     
     print("[SDXL-Turbo] Model loaded successfully!")
     return pipe
@@ -63,16 +89,13 @@ def load_models():
     on_start=load_models,  # Load model at startup
     secrets=["HF_TOKEN"],
 )
-def generate_image(context, prompt: str, aspect_ratio: str = "9:16") -> dict:
+def generate_image(context, prompt: Union[str, List[str]], aspect_ratio: str = "9:16", seed: int = None,
+                   image_format: str = "webp") -> dict:
     """
     Generate an image using SDXL-Turbo.
     
     The model is pre-loaded via on_start, accessible via context.on_start_value
     """
-    import torch
-    import base64
-    from io import BytesIO
-    
     pipe = context.on_start_value  # Get pre-loaded model
     
     # Determine resolution
@@ -83,30 +106,40 @@ def generate_image(context, prompt: str, aspect_ratio: str = "9:16") -> dict:
     else:
         width, height = 768, 768
     
-    enhanced_prompt = f"{prompt}. Cinematic, high quality, 8k, photorealistic."
-    
-    print(f"[SDXL-Turbo] Generating: '{enhanced_prompt[:60]}...'")
-    
-    result = pipe(
-        prompt=enhanced_prompt,
-        width=width,
-        height=height,
-        num_inference_steps=4,
-        guidance_scale=0.0,
-        generator=torch.Generator("cuda").manual_seed(42),
-    )
+    prompts = prompt if isinstance(prompt, list) else [prompt]
+    if not prompts:
+        raise ValueError("prompt list is empty")
+    base_seed = resolve_seed(seed)
     
-    image = result.images[0]
+    print(f"[SDXL-Turbo] Generating {len(prompts)} image(s): '{prompts[0][:60]}...'")
     
-    buffer = BytesIO()
-    image.save(buffer, format="PNG", optimize=True)
-    buffer.seek(0)
-    image_base64 = base64.b64encode(buffer.read()).decode("utf-8")
+    # Only batch 1 and MAX_BATCH_SIZE were compiled at startup, so short batches are padded up to it
+    batch_size = 1 if len(prompts) == 1 else MAX_BATCH_SIZE
+    images_base64 = []
+    for start, batch, call_prompts in prompt_batches(prompts, batch_size, pad=True):
+        result = pipe(
+            prompt=[f"{p}. Cinematic, high quality, 8k, photorealistic." for p in call_prompts],
+            width=width,
+            height=height,
+            num_inference_steps=4,
+            guidance_scale=0.0,
+            generator=seeded_generators(pipe, base_seed + start, batch_size),
+        )
+        
+        images_base64.extend(image_data_url(image, image_format) for image in result.images[:len(batch)])
     
     print(f"[SDXL-Turbo] Done ({width}x{height})")
     
+    if isinstance(prompt, list):
+        return {
+            "images_base64": images_base64,
+            "width": width,
+            "height": height,
+            "seed": base_seed,
+        }
     return {
-        "image_base64": f"data:image/png;base64,{image_base64}",
+        "image_base64": images_base64[0],
         "width": width,
         "height": height,
+        "seed": base_seed,
     }
@@ -5,11 +5,13 @@ SDXL-Turbo is a distilled version of SDXL that generates high-quality images in
 Much simpler to deploy than FLUX1 and produces excellent results.
 
 Deploy with:
-    beam deploy beam_sdxl_turbo.py:generate_image
+    beam deploy scripts/beam_sdxl_turbo.py:generate_image
 """
 
 from beam import endpoint, Image, Volume
 
+from scripts.beam_gpu_core import configure_runtime, image_data_url, make_generators, resolve_seed, seeded_generators
+
 image = Image(
     python_version="python3.10",
     python_packages=[
@@ -20,11 +22,49 @@ image = Image(
         "safetensors",
         "Pillow",
         "invisible_watermark",  # Required by SDXL
+        "pybase64",
     ],
 )
 
 model_volume = Volume(name="sdxl-turbo-cache", mount_path="/cache")
 
+# (width, height) of the standard-quality 9:16, 16:9 and 1:1 requests; "hd" sizes compile on first use
+WARMUP_SHAPES = [(576, 1024), (1024, 576), (768, 768)]
+
+
+def load_models():
+    """Load SDXL-Turbo once at container startup and keep it resident on the GPU."""
+    import torch
+    
+    configure_runtime("/cache", compile_cache=True)
+    # Imported after configure_runtime, which sets the HF_* variables huggingface_hub reads at import time
+    from diffusers import AutoPipelineForText2Image
+    
+    print("[SDXL-Turbo] Loading model...")
+    
+    pipe = AutoPipelineForText2Image.from_pretrained(
+        "stabilityai/sdxl-turbo",
+        torch_dtype=torch.float16,
+        variant="fp16",
+        cache_dir="/cache"
+    )
+    pipe = pipe.to("cuda")
+    pipe.set_progress_bar_config(disable=True)
+    make_generators(pipe)
+    
+    # The UNet is almost all of a 4-step request; compile it (and the VAE decode) and pay
+    # the compile here with a warmup pass rather than on the first real request
+    pipe.unet = torch.compile(pipe.unet, mode="reduce-overhead", fullgraph=False)
+    pipe.vae.decode = torch.compile(pipe.vae.decode, mode="reduce-overhead")
+    # Warm every advertised resolution at the served step count, twice per shape: CUDA graphs are
+    # recorded on a compiled function's second call, and the VAE decode runs only once per pass
+    for width, height in WARMUP_SHAPES:
+        for _ in range(2):
+            pipe("warmup", num_inference_steps=4, guidance_scale=0.0, width=width, height=height)
+    
+    print("[SDXL-Turbo] Model loaded!")
+    return pipe
+
 
 @endpoint(
     name="sdxl-turbo-image",
@@ -34,28 +74,25 @@ model_volume = Volume(name="sdxl-turbo-cache", mount_path="/cache")
     cpu=4,
     volumes=[model_volume],
     keep_warm_seconds=60,
+    on_start=load_models,
     secrets=["HF_TOKEN"],
 )
 def generate_image(
+    context,
     prompt: str,
     aspect_ratio: str = "9:16",
     num_inference_steps: int = 4,
     guidance_scale: float = 0.0,
     quality: str = "standard",
+    seed: int = None,
+    image_format: str = "webp",
 ) -> dict:
     """
     Generate an image using SDXL-Turbo (stabilityai/sdxl-turbo).
     Very fast (~2s per image) with excellent quality.
     """
-    import torch
-    from diffusers import AutoPipelineForText2Image
-    from PIL import Image as PILImage
-    import base64
-    from io import BytesIO
-    import os
-    
-    os.environ["HF_HOME"] = "/cache"
-    os.environ["TRANSFORMERS_CACHE"] = "/cache"
+    pipe = context.on_start_value
+    seed = resolve_seed(seed)
     
     # Determine resolution
     if aspect_ratio == "9:16":
@@ -65,16 +102,6 @@ def generate_image(
     else:
         width, height = (768, 768) if quality == "standard" else (1024, 1024)
     
-    print(f"[SDXL-Turbo] Loading model...")
-    
-    pipe = AutoPipelineForText2Image.from_pretrained(
-        "stabilityai/sdxl-turbo",
-        torch_dtype=torch.float16,
-        variant="fp16",
-        cache_dir="/cache"
-    )
-    pipe = pipe.to("cuda")
-    
     # Enhance prompt for cinematic quality
     enhanced_prompt = f"{prompt}. Style: Cinematic, high quality, 8k, photorealistic, dramatic lighting."
     
@@ -86,20 +113,16 @@ def generate_image(
         height=height,
         num_inference_steps=num_inference_steps,
         guidance_scale=guidance_scale,
-        generator=torch.Generator("cuda").manual_seed(42),
+        generator=seeded_generators(pipe, seed),
     )
     
-    image = result.images[0]
-    
-    buffer = BytesIO()
-    image.save(buffer, format="PNG", optimize=True)
-    buffer.seek(0)
-    image_base64 = base64.b64encode(buffer.read()).decode("utf-8")
+    image_url = image_data_url(result.images[0], image_format)
     
     print(f"[SDXL-Turbo] Done ({width}x{height})")
     
     return {
-        "image_base64": f"data:image/png;base64,{image_base64}",
+        "image_base64": image_url,
         "width": width,
         "height": height,
+        "seed": seed,
     }
@@ -4,36 +4,54 @@ SDXL-Turbo Image Generation - Fixed Dependencies
 Using latest compatible versions to avoid dependency conflicts.
 
 Deploy with:
-    beam deploy beam_sdxl_v3.py:generate_image
+    beam deploy scripts/beam_sdxl_v3.py:generate_image
 """
 
+from typing import List, Union
+
 from beam import endpoint, Image, Volume
 
+from scripts.beam_gpu_core import (
+    configure_runtime, image_data_url, make_generators, prompt_batches, resolve_seed, seeded_generators,
+)
+
 # Use latest compatible versions
 image = Image(
     python_version="python3.10",
     python_packages=[
-        "torch",
+        # torchao wheels are built against one torch release; bump the pair together
+        "torch==2.7.0",
         "diffusers",
         "transformers",
         "accelerate",
         "safetensors",
         "Pillow",
         "huggingface_hub",
+        "torchao==0.10.0",
+        "pybase64",
     ],
 )
 
 model_volume = Volume(name="sdxl-turbo-v3", mount_path="/cache")
 
+# (width, height) for the 9:16, 16:9 and 1:1 aspect ratios served below
+WARMUP_SHAPES = [(576, 1024), (1024, 576), (768, 768)]
+
+# Prompts per pipeline call when a list is sent; 4 at 576x1024 fits the A10G
+MAX_BATCH_SIZE = 4
+
+# Largest mean absolute pixel difference (0-1 scale) allowed between the int8 and fp16 UNet on a fixed seed
+INT8_MAX_PIXEL_ERROR = 0.02
+
 
 def load_models():
     """Load model at container startup."""
     import os
     import torch
-    from diffusers import AutoPipelineForText2Image
     
-    os.environ["HF_HOME"] = "/cache"
-    os.environ["TRANSFORMERS_CACHE"] = "/cache"
+    configure_runtime("/cache", compile_cache=True)
+    # Imported after configure_runtime, which sets the HF_* variables huggingface_hub reads at import time
+    from diffusers import AutoPipelineForText2Image
     
     # Get HF token from environment
     hf_token = os.environ.get("HF_TOKEN", "")
@@ -50,11 +68,49 @@ def load_models():
     )
     pipe = pipe.to("cuda")
     pipe.set_progress_bar_config(disable=True)
+    make_generators(pipe, MAX_BATCH_SIZE)
+    
+    # The UNet is almost all of a 4-step request; int8 weight-only quantization halves its weight traffic
+    quantize_unet_int8(pipe)
+    pipe.unet = torch.compile(pipe.unet, mode="reduce-overhead", fullgraph=False)
+    pipe.vae.decode = torch.compile(pipe.vae.decode, mode="reduce-overhead")
+    # Compile every advertised resolution at the served step count and at both batch sizes requests
+    # run at; CUDA graphs are recorded on each shape's first real call
+    for width, height in WARMUP_SHAPES:
+        for batch_size in (1, MAX_BATCH_SIZE):
+            pipe(["warmup"] * batch_size, num_inference_steps=4, guidance_scale=0.0, width=width, height=height)
     
     print("[SDXL-Turbo] Model loaded!")
     return pipe
 
 
+def quantize_unet_int8(pipe):
+    """Swap in an int8 weight-only UNet if it renders a fixed-seed image within INT8_MAX_PIXEL_ERROR of fp16; otherwise keep fp16."""
+    import copy
+    import torch
+    
+    try:
+        from torchao.quantization import Int8WeightOnlyConfig, quantize_
+    except ImportError as e:
+        print(f"[SDXL-Turbo] torchao unavailable, keeping the fp16 UNet: {e}")
+        return
+    
+    def render():
+        return pipe("a red fox in fresh snow", num_inference_steps=4, guidance_scale=0.0, width=768, height=768,
+                    generator=torch.Generator("cuda").manual_seed(0), output_type="pt").images
+    
+    reference = render()
+    fp16_unet = pipe.unet
+    pipe.unet = copy.deepcopy(fp16_unet)
+    quantize_(pipe.unet, Int8WeightOnlyConfig())
+    error = (render() - reference).abs().mean().item()
+    if error > INT8_MAX_PIXEL_ERROR:
+        print(f"[SDXL-Turbo] int8 UNet off by {error:.4f} from fp16, keeping fp16")
+        pipe.unet = fp16_unet
+    else:
+        print(f"[SDXL-Turbo] int8 UNet within {error:.4f} of fp16")
+
+
 @endpoint(
     name="sdxl-turbo-v3",
     image=image,
@@ -66,12 +122,9 @@ def load_models():
     on_start=load_models,
     secrets=["HF_TOKEN"],
 )
-def generate_image(context, prompt: str, aspect_ratio: str = "9:16") -> dict:
+def generate_image(context, prompt: Union[str, List[str]], aspect_ratio: str = "9:16", seed: int = None,
+                   image_format: str = "webp") -> dict:
     """Generate image with pre-loaded model."""
-    import torch
-    import base64
-    from io import BytesIO
-    
     pipe = context.on_start_value
     
     if aspect_ratio == "9:16":
@@ -81,28 +134,37 @@ def generate_image(context, prompt: str, aspect_ratio: str = "9:16") -> dict:
     else:
         width, height = 768, 768
     
-    enhanced_prompt = f"{prompt}. Cinematic, high quality, 8k, photorealistic."
-    
-    print(f"[SDXL-Turbo] Generating: '{enhanced_prompt[:60]}...'")
-    
-    result = pipe(
-        prompt=enhanced_prompt,
-        width=width,
-        height=height,
-        num_inference_steps=4,
-        guidance_scale=0.0,
-        generator=torch.Generator("cuda").manual_seed(42),
-    )
+    prompts = prompt if isinstance(prompt, list) else [prompt]
+    if not prompts:
+        raise ValueError("prompt list is empty")
+    base_seed = resolve_seed(seed)
     
-    image = result.images[0]
+    print(f"[SDXL-Turbo] Generating {len(prompts)} image(s): '{prompts[0][:60]}...'")
     
-    buffer = BytesIO()
-    image.save(buffer, format="PNG", optimize=True)
-    buffer.seek(0)
-    image_base64 = base64.b64encode(buffer.read()).decode("utf-8")
+    batch_size = 1 if len(prompts) == 1 else MAX_BATCH_SIZE
+    images_base64 = []
+    for start, batch, call_prompts in prompt_batches(prompts, batch_size, pad=True):
+        result = pipe(
+            prompt=[f"{p}. Cinematic, high quality, 8k, photorealistic." for p in call_prompts],
+            width=width,
+            height=height,
+            num_inference_steps=4,
+            guidance_scale=0.0,
+            generator=seeded_generators(pipe, base_seed + start, batch_size),
+        )
+        
+        images_base64.extend(image_data_url(image, image_format) for image in result.images[:len(batch)])
     
+    if isinstance(prompt, list):
+        return {
+            "images_base64": images_base64,
+            "width": width,
+            "height": height,
+            "seed": base_seed,
+        }
     return {
-        "image_base64": f"data:image/png;base64,{image_base64}",
+        "image_base64": images_base64[0],
         "width": width,
         "height": height,
+        "seed": base_seed,
     }
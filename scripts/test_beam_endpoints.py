@@ -0,0 +1,168 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import sys
+import os
+
+# Mock the 'beam' module which only exists in the cloud environment; @endpoint must hand back
+# the plain function so the handlers can be called directly
+sys.modules['beam'] = MagicMock()
+sys.modules['beam'].endpoint = lambda **kwargs: (lambda fn: fn)
+
+from scripts import beam_gpu_core, beam_hunyuan_video, beam_mochi_video
+
+
+class TestGpuCore(unittest.TestCase):
+
+    def test_prompt_batches_pads_short_last_batch(self):
+        batches = list(beam_gpu_core.prompt_batches(["a", "b", "c", "d", "e"], 4, pad=True))
+        self.assertEqual(batches, [(0, ["a", "b", "c", "d"], ["a", "b", "c", "d"]), (4, ["e"], ["e", "e", "e", "e"])])
+
+        unpadded = list(beam_gpu_core.prompt_batches(["a", "b", "c"], 2))
+        self.assertEqual(unpadded, [(0, ["a", "b"], ["a", "b"]), (2, ["c"], ["c"])])
+
+    def test_seeded_generators_give_one_seed_per_image(self):
+        pipe = MagicMock(_generators=[MagicMock() for _ in range(4)])
+        for generator in pipe._generators:
+            generator.manual_seed.side_effect = lambda seed, g=generator: g
+
+        self.assertIs(beam_gpu_core.seeded_generators(pipe, 7), pipe._generators[0])
+        self.assertEqual(beam_gpu_core.seeded_generators(pipe, 10, 3), pipe._generators[:3])
+        self.assertEqual([g.manual_seed.call_args.args[0] for g in pipe._generators[:3]], [10, 11, 12])
+
+    def test_resolve_seed_keeps_explicit_seed(self):
+        self.assertEqual(beam_gpu_core.resolve_seed(0), 0)
+        self.assertIsInstance(beam_gpu_core.resolve_seed(None), int)
+
+
+class TestHunyuanVideo(unittest.TestCase):
+
+    def setUp(self):
+        self.torch = MagicMock()
+        self.diffusers_utils = MagicMock()
+        modules = {
+            'torch': self.torch,
+            'diffusers': MagicMock(utils=self.diffusers_utils),
+            'diffusers.utils': self.diffusers_utils,
+        }
+        for patcher in (
+            patch.dict(sys.modules, modules),
+            patch.dict(os.environ, {}, clear=False),
+            patch.object(beam_hunyuan_video.os, 'makedirs'),
+            patch.object(beam_hunyuan_video, 'file_to_data_uri', return_value="data:video/mp4;base64,AAAA"),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        os.environ.pop("CLOUDINARY_URL", None)
+
+    def test_generate_video_snaps_frames_and_returns_url(self):
+        pipe = MagicMock()
+        pipe.return_value.frames = [["frame"] * 85]
+        context = MagicMock(on_start_value=pipe)
+
+        result = beam_hunyuan_video.generate_video(context, "a fox in the snow", duration_seconds=3.5, fps=24, seed=7)
+
+        # 3.5 s at 24 fps = 84 frames, snapped to the 4k + 1 grid
+        self.assertEqual(pipe.call_args.kwargs['num_frames'], 85)
+        self.torch.cuda.manual_seed_all.assert_called_once_with(7)
+        self.diffusers_utils.export_to_video.assert_called_once()
+        self.assertEqual(result['video_url'], "data:video/mp4;base64,AAAA")
+        self.assertAlmostEqual(result['duration_seconds'], 85 / 24)
+
+    def test_generate_video_clamps_frame_count(self):
+        pipe = MagicMock()
+        pipe.return_value.frames = [[]]
+        context = MagicMock(on_start_value=pipe)
+
+        beam_hunyuan_video.generate_video(context, "long", duration_seconds=60, fps=24)
+        self.assertEqual(pipe.call_args.kwargs['num_frames'], 129)
+
+        beam_hunyuan_video.generate_video(context, "short", duration_seconds=0.05, fps=24)
+        self.assertEqual(pipe.call_args.kwargs['num_frames'], 5)
+
+    def test_generate_video_without_weights_fails_fast(self):
+        context = MagicMock(on_start_value=None)
+        with self.assertRaisesRegex(Exception, "Model weights missing"):
+            beam_hunyuan_video.generate_video(context, "anything")
+
+
+class RepositoryNotFoundError(Exception):
+    pass
+
+
+class GatedRepoError(RepositoryNotFoundError):
+    pass
+
+
+class TestMochiLoader(unittest.TestCase):
+
+    def setUp(self):
+        self.mochi_cls = MagicMock(__name__="MochiPipeline")
+        self.cogvideox_cls = MagicMock(__name__="CogVideoXPipeline")
+        self.cogvideox_pipe = MagicMock()
+        self.cogvideox_pipe.to.return_value = self.cogvideox_pipe
+        self.cogvideox_cls.from_pretrained.return_value = self.cogvideox_pipe
+        modules = {
+            'torch': MagicMock(),
+            'diffusers': MagicMock(MochiPipeline=self.mochi_cls, CogVideoXPipeline=self.cogvideox_cls),
+            'huggingface_hub': MagicMock(),
+            'huggingface_hub.utils': MagicMock(GatedRepoError=GatedRepoError, RepositoryNotFoundError=RepositoryNotFoundError),
+        }
+        for patcher in (
+            patch.dict(sys.modules, modules),
+            patch.object(beam_mochi_video, 'configure_runtime'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def wrapped_hub_error(hub_error):
+        """Raise the OSError diffusers raises for a Hub error, chained the way from_pretrained chains it."""
+        def from_pretrained(*args, **kwargs):
+            try:
+                raise hub_error
+            except RepositoryNotFoundError as e:
+                raise OSError("genmo/mochi-1-preview is not a local folder and is not a valid model identifier") from e
+        return from_pretrained
+
+    def test_gated_mochi_falls_back_to_cogvideox(self):
+        self.mochi_cls.from_pretrained.side_effect = self.wrapped_hub_error(GatedRepoError("gated"))
+
+        pipe = beam_mochi_video.load_model()
+
+        self.assertIs(pipe, self.cogvideox_pipe)
+        self.assertEqual(pipe.backend, "cogvideox")
+        self.assertEqual(self.cogvideox_cls.from_pretrained.call_args.args[0], "THUDM/CogVideoX-2B")
+
+    def test_missing_mochi_repo_falls_back_to_cogvideox(self):
+        self.mochi_cls.from_pretrained.side_effect = self.wrapped_hub_error(RepositoryNotFoundError("missing"))
+
+        self.assertEqual(beam_mochi_video.load_model().backend, "cogvideox")
+
+    def test_other_load_errors_are_not_swallowed(self):
+        self.mochi_cls.from_pretrained.side_effect = OSError("Connection reset by peer")
+
+        with self.assertRaisesRegex(OSError, "Connection reset"):
+            beam_mochi_video.load_model()
+        self.cogvideox_cls.from_pretrained.assert_not_called()
+
+    def test_cogvideox_crops_to_requested_aspect(self):
+        import numpy as np
+        imageio_v3 = MagicMock()
+        imageio_v3.imwrite.return_value = b"mp4"
+        pybase64 = MagicMock()
+        pybase64.b64encode.return_value = b"AAAA"
+        pipe = MagicMock(backend="cogvideox", _generators=[MagicMock()])
+        pipe.return_value.frames = [[np.zeros((480, 720, 3), dtype=np.uint8)] * 49]
+        context = MagicMock(on_start_value=pipe)
+
+        with patch.dict(sys.modules, {'imageio': MagicMock(v3=imageio_v3), 'imageio.v3': imageio_v3, 'pybase64': pybase64}):
+            result = beam_mochi_video.generate_video(context, "a fox in the snow", aspect_ratio="9:16")
+
+        # CogVideoX-2B only samples 720x480; the clip is center-cropped to portrait before encoding
+        self.assertEqual((pipe.call_args.kwargs['width'], pipe.call_args.kwargs['height']), (720, 480))
+        self.assertEqual(imageio_v3.imwrite.call_args.args[1].shape, (49, 480, 270, 3))
+        self.assertEqual((result['width'], result['height']), (270, 480))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,12 +2,14 @@ import unittest
 from unittest.mock import MagicMock, patch
 import sys
 import os
+import tempfile
 
 # Mock the 'beam' module which only exists in the cloud environment
 sys.modules['beam'] = MagicMock()
 
 # Now we can import the render script
-from scripts.beam_ffmpeg_render import build_ffmpeg_command, get_duration
+from scripts import beam_ffmpeg_render
+from scripts.beam_ffmpeg_render import build_ffmpeg_command, get_duration, _graph_template, apply_ass_style, download_file, run_ffmpeg
 
 class TestFFmpegRender(unittest.TestCase):
 
@@ -93,16 +95,98 @@ class TestFFmpegRender(unittest.TestCase):
         # Verify audio tag mapping
         self.assertIn("-map [vo_standard]", cmd_str)
 
+    def test_filter_graph_template_reused_for_same_shape(self):
+        # Scenario: Two renders with the same timeline shape but different durations
+        _graph_template.cache_clear()
+        short = [{'type': 'image', 'path': '/tmp/a.png', 'duration': 2.0}]
+        long = [{'type': 'image', 'path': '/tmp/b.png', 'duration': 5.0}]
+
+        cmd_short = build_ffmpeg_command("/tmp/vo.mp3", None, None, short, None, None, 2.0, "/tmp/out.mp4")
+        cmd_long = build_ffmpeg_command("/tmp/vo.mp3", None, None, long, None, None, 5.0, "/tmp/out.mp4")
+
+        # Second render hits the cached skeleton; only the frame count differs
+        self.assertEqual(_graph_template.cache_info().hits, 1)
+        self.assertIn("d=48:", " ".join(cmd_short))
+        self.assertIn("d=120:", " ".join(cmd_long))
+
+    def test_ass_subtitles_use_ass_filter(self):
+        # Scenario: Subtitles already converted to styled ASS
+        visuals = [{'type': 'image', 'path': '/tmp/a.png', 'duration': 2.0}]
+        cmd_str = " ".join(build_ffmpeg_command("/tmp/vo.mp3", None, "/cache/subs/abc.ass", visuals, None, None, 2.0, "/tmp/out.mp4"))
+
+        self.assertIn("[v_base]ass=/cache/subs/abc.ass[v_burned]", cmd_str)
+        self.assertNotIn("force_style", cmd_str)
+
+    def test_apply_ass_style_overrides_default_style(self):
+        lines = [
+            "[V4+ Styles]",
+            "Format: Name, Fontname, Fontsize, PrimaryColour, Bold",
+            "Style: Default,Arial,16,&Hffffff,0",
+            "Dialogue: 0,0:00:00.00,0:00:01.00,Default,,0,0,0,,Hello, world",
+        ]
+
+        styled = apply_ass_style(lines, {'Fontsize': '24', 'PrimaryColour': '&H00FFFFFF'})
+
+        self.assertEqual(styled[2], "Style: Default,Arial,24,&H00FFFFFF,0")
+        self.assertEqual(styled[3], lines[3])
+
+    def test_encoder_preset_follows_timeline_content(self):
+        stills = [{'type': 'image', 'path': '/tmp/a.png', 'duration': 2.0}]
+        mixed = stills + [{'type': 'video', 'path': '/tmp/b.mp4', 'duration': 3.0}]
+
+        stills_cmd = " ".join(build_ffmpeg_command("/tmp/vo.mp3", None, None, stills, None, None, 2.0, "/tmp/out.mp4"))
+        mixed_cmd = " ".join(build_ffmpeg_command("/tmp/vo.mp3", None, None, mixed, None, None, 5.0, "/tmp/out.mp4"))
+
+        self.assertIn("-preset ultrafast -tune stillimage", stills_cmd)
+        self.assertIn("-preset superfast", mixed_cmd)
+        self.assertNotIn("stillimage", mixed_cmd)
+        # Both keep the 2 Mbps size cap
+        self.assertIn("-maxrate 2M -bufsize 4M", mixed_cmd)
+
+    def test_prelooped_music_bed_is_not_stream_looped(self):
+        visuals = [{'type': 'image', 'path': '/tmp/a.png', 'duration': 2.0}]
+        cmd_str = " ".join(build_ffmpeg_command("/tmp/vo.mp3", "/tmp/music_bed.wav", None, visuals, None, None, 2.0, "/tmp/out.mp4", loop_music=False))
+
+        self.assertIn("-i /tmp/music_bed.wav", cmd_str)
+        self.assertNotIn("-stream_loop", cmd_str)
+        self.assertIn("amix=inputs=2:duration=first", cmd_str)
+
+    @patch('scripts.beam_ffmpeg_render.requests.get')
+    def test_cached_download_reuses_asset_for_same_url(self, mock_get):
+        # Scenario: Two jobs use the same brand music URL
+        mock_get.return_value.__enter__.return_value.iter_content.return_value = [b"ID3", b"audio"]
+        with tempfile.TemporaryDirectory() as tmp, patch.object(beam_ffmpeg_render, 'ASSET_CACHE_DIR', f"{tmp}/assets"):
+            first = download_file("https://cdn.example.com/music.mp3", f"{tmp}/job1_music.mp3", cache=True)
+            second = download_file("https://cdn.example.com/music.mp3", f"{tmp}/job2_music.mp3", cache=True)
+
+            # Only the first job hits the network; both get a symlink to the same cached file
+            self.assertEqual(mock_get.call_count, 1)
+            self.assertEqual(os.path.realpath(first), os.path.realpath(second))
+            with open(second, 'rb') as f:
+                self.assertEqual(f.read(), b"ID3audio")
+
+    def test_run_ffmpeg_keeps_only_stderr_tail(self):
+        # Stand-in process writing 250 stderr lines then failing
+        script = "import sys\nfor i in range(250): print(f'line {i}', file=sys.stderr)\nsys.exit(3)"
+        with patch('builtins.print'):
+            returncode, tail = run_ffmpeg([sys.executable, '-c', script], timeout=30)
+
+        lines = tail.splitlines()
+        self.assertEqual(returncode, 3)
+        self.assertEqual(len(lines), 200)
+        self.assertEqual(lines[0], "line 50")
+        self.assertEqual(lines[-1], "line 249")
+
     @patch('subprocess.run')
     def test_get_duration(self, mock_run):
         # Mock ffprobe output
-        mock_run.return_value = MagicMock(stdout="45.67\n", returncode=0)
+        mock_run.return_value = MagicMock(stdout='{"format": {"duration": "45.67"}}\n', returncode=0)
         
         duration = get_duration("/tmp/test.mp3")
         
         self.assertEqual(duration, 45.67)
         mock_run.assert_called_with(
-            ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1', '/tmp/test.mp3'],
+            ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'json', '/tmp/test.mp3'],
             capture_output=True, text=True, check=True
         )
 
@@ -0,0 +1,54 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import sys
+import os
+
+# Mock 'transformers' (only installed where the classifier runs); pipeline() is only called lazily
+sys.modules['transformers'] = MagicMock()
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'infrastructure', 'intelligence'))
+
+import web_organizer
+
+
+class TestZeroShotFallback(unittest.TestCase):
+
+    def setUp(self):
+        self.classifier = MagicMock()
+        for patcher in (
+            patch.object(web_organizer, 'web_organizer_available', return_value=False),
+            patch.object(web_organizer, 'get_zero_shot_classifier', return_value=self.classifier),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_topic_and_format_come_from_one_multi_label_call(self):
+        # Independent sigmoid scores, ranked highest first; a format outranks every topic
+        self.classifier.return_value = {
+            'labels': ["Ecommerce Store", "Finance/Business", "Landing Page", "Science & Technology"],
+            'scores': [0.97, 0.91, 0.64, 0.88],
+        }
+
+        result = web_organizer.classify_site("Shop our winter collection")
+
+        self.classifier.assert_called_once()
+        args, kwargs = self.classifier.call_args
+        self.assertTrue(kwargs['multi_label'])
+        self.assertIn("Finance/Business", args[1])
+        self.assertIn("Ecommerce Store", args[1])
+        self.assertEqual(result, {"topic": "Finance/Business", "format": "Ecommerce Store", "confidence": 0.91})
+
+    def test_confidence_is_the_topic_score_not_renormalised(self):
+        self.classifier.return_value = {
+            'labels': ["Health/Medicine", "Local Service", "News/Media"],
+            'scores': [0.42, 0.40, 0.39],
+        }
+
+        result = web_organizer.classify_site("Dental practice in Berlin")
+
+        self.assertEqual(result["topic"], "Health/Medicine")
+        self.assertEqual(result["format"], "Local Service")
+        self.assertEqual(result["confidence"], 0.42)
+
+
+if __name__ == '__main__':
+    unittest.main()
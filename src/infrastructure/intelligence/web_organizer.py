@@ -2,6 +2,7 @@ import sys
 import json
 import logging
 import contextlib
+import functools
 import os
 from transformers import pipeline
 
@@ -19,6 +20,37 @@ def suppress_stdout():
     finally:
         sys.stdout = original_stdout
 
+@functools.lru_cache(maxsize=1)
+def _device():
+    """First GPU when one is present, else CPU (pipeline device convention). Probed once per process."""
+    import torch
+    return 0 if torch.cuda.is_available() else -1
+
+@functools.lru_cache(maxsize=1)
+def web_organizer_available():
+    """Probe both WebOrganizer repos for their config only, once per process, before committing to the full loads."""
+    from huggingface_hub import hf_hub_download
+    try:
+        for repo_id in ("WebOrganizer/TopicClassifier", "WebOrganizer/FormatClassifier"):
+            hf_hub_download(repo_id, "config.json")
+        return True
+    except Exception as e:
+        logger.warning(f"WebOrganizer probe failed: {e}")
+        return False
+
+@functools.lru_cache(maxsize=1)
+def get_web_organizer_classifiers():
+    """Load the WebOrganizer topic and format classifiers once per process."""
+    device = _device()
+    topic_clf = pipeline("text-classification", model="WebOrganizer/TopicClassifier", trust_remote_code=True, device=device)
+    format_clf = pipeline("text-classification", model="WebOrganizer/FormatClassifier", trust_remote_code=True, device=device)
+    return topic_clf, format_clf
+
+@functools.lru_cache(maxsize=1)
+def get_zero_shot_classifier():
+    """Load the zero-shot fallback classifier once per process."""
+    return pipeline("zero-shot-classification", model="facebook/bart-large-mnli", device=_device())
+
 def classify_site(text):
     """
     Classifies website text using WebOrganizer models.
@@ -27,8 +59,9 @@ def classify_site(text):
         try:
             # Load SOTA Classifiers (WebOrganizer arXiv:2502.10341)
             try:
-                topic_clf = pipeline("text-classification", model="WebOrganizer/TopicClassifier", trust_remote_code=True)
-                format_clf = pipeline("text-classification", model="WebOrganizer/FormatClassifier", trust_remote_code=True)
+                if not web_organizer_available():
+                    raise RuntimeError("WebOrganizer models unavailable")
+                topic_clf, format_clf = get_web_organizer_classifiers()
                 
                 # Predict
                 topic_res = topic_clf(text[:512]) 
@@ -44,18 +77,24 @@ def classify_site(text):
                 logger.info("Falling back to Zero-Shot Classification...")
                 
                 # Fallback
-                classifier = pipeline("zero-shot-classification", model="facebook/bart-large-mnli")
+                classifier = get_zero_shot_classifier()
                 
                 topics = ["Science & Technology", "Finance/Business", "Home/Hobbies", "Health/Medicine", "Arts/Entertainment", "News/Media"]
                 formats = ["Landing Page", "Ecommerce Store", "Portfolio", "Local Service", "Blog/News"]
                 
-                topic_res = classifier(text, topics)
-                format_res = classifier(text, formats)
+                # One pipeline call over both label sets saves a call's overhead, not NLI compute: every
+                # label is still its own premise/hypothesis pair. multi_label scores each label with an
+                # independent entailment sigmoid instead of a softmax over the topics, so the ranking can
+                # be split by label set and confidence is the winning topic's own score
+                res = classifier(text[:512], topics + formats, multi_label=True)
+                ranked = list(zip(res['labels'], res['scores']))
+                topic, topic_score = next((label, score) for label, score in ranked if label in topics)
+                page_format = next(label for label, _ in ranked if label in formats)
                 
                 return {
-                    "topic": topic_res['labels'][0],
-                    "format": format_res['labels'][0],
-                    "confidence": topic_res['scores'][0]
+                    "topic": topic,
+                    "format": page_format,
+                    "confidence": topic_score
                 }
 
         except Exception as e: